@@ -1,129 +1,508 @@
-import json
+import asyncio
+import copy
+import hashlib
+import queue
+import threading
+import time
+from typing import Callable
+import orjson
 import streamlit as st
-from openai import OpenAI
+from openai import AsyncOpenAI
+from pydantic import BaseModel
 
-def _get_client():
-    return OpenAI(
+# Seconds to wait for a model's first streamed chunk before hedging with the next fallback in parallel.
+# Well above a reasoning model's normal time-to-first-token, so the selected model answers (and gets cached)
+# unless it fails or has actually stalled; a failure still starts the next model at once.
+HEDGE_STAGGER_S = 20.0
+
+# Output caps sized from the most bullets each prompt allows (summary 5+4+4, explain 4+6+4) at ~45 tokens
+# per number-quoting bullet, plus headline/JSON overhead and 25% headroom. A response that still hits the cap
+# is treated as a failed attempt (see _check_finish), never parsed.
+_TOKENS_PER_BULLET = 45
+_TOKENS_OVERHEAD = 100
+SUMMARY_MAX_TOKENS = int(((5 + 4 + 4) * _TOKENS_PER_BULLET + _TOKENS_OVERHEAD) * 1.25)
+EXPLAIN_MAX_TOKENS = int(((4 + 6 + 4) * _TOKENS_PER_BULLET + _TOKENS_OVERHEAD) * 1.25)
+
+# Per-task sampling: the summary is the broader ("macro") answer, the explanation the tighter ("micro") one.
+SUMMARY_TEMPERATURE = 0.3
+EXPLAIN_TEMPERATURE = 0.2
+TOP_P = 0.9
+
+class SummaryOut(BaseModel):
+    headline: str
+    summary_bullets: list[str]
+    key_changes: list[str] = []
+    next_checks: list[str] = []
+
+class ExplainOut(BaseModel):
+    headline: str
+    what_changed: list[str]
+    likely_drivers: list[str] = []
+    next_checks: list[str] = []
+
+@st.cache_resource(show_spinner=False)
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    One event loop on a daemon thread, shared across reruns and sessions. The cached client's connection
+    pool is bound to the loop it first runs on, so every request goes through this one.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="openai-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource(show_spinner=False)
+def _get_client() -> AsyncOpenAI:
+    """
+    One client (and the SDK's default keep-alive connection pool) shared across reruns and sessions.
+    Only used on _get_loop().
+    """
+    return AsyncOpenAI(
         api_key=st.secrets["OPENAI_API_KEY"],
         project=st.secrets["OPENAI_PROJECT_ID"],
     )
-st.write("Project ID loaded:", st.secrets.get("OPENAI_PROJECT_ID"))
 
-def _call_with_fallback(client: OpenAI, models: list[str], messages: list[dict], temperature: float = 0.2) -> tuple[str, str]:
+_DONE = object()
+
+def _run_on_loop(job: Callable, on_token: Callable[[str], None] | None = None):
+    """
+    Run job(client, forward_token) on the shared loop and block until it returns. Text passed to forward_token
+    is handed back to this (script) thread and given to on_token, so it can draw into Streamlit placeholders.
+    If this thread is interrupted (e.g. a rerun stops the script), the job is cancelled.
+    """
+    updates = queue.SimpleQueue()
+    forward = updates.put if on_token is not None else None
+    fut = asyncio.run_coroutine_threadsafe(job(_get_client(), forward), _get_loop())
+    fut.add_done_callback(lambda _: updates.put(_DONE))
+    try:
+        done = False
+        while not done:
+            items = [updates.get()]
+            while not updates.empty():
+                items.append(updates.get())
+            if items[-1] is _DONE:
+                done = True
+                items.pop()
+            # Each update is the full text so far, so only the newest one needs drawing
+            if items:
+                on_token(items[-1])
+        return fut.result()
+    except BaseException:
+        fut.cancel()
+        raise
+
+class TruncatedResponseError(RuntimeError):
+    """The model stopped at the output token cap, so its JSON is incomplete."""
+
+def _check_finish(finish_reason: str | None, model: str):
+    if finish_reason == "length":
+        raise TruncatedResponseError(f"{model} hit the output token limit")
+
+# Minimum seconds between on_token UI updates while streaming (each update re-sends the full text)
+_STREAM_FLUSH_S = 0.1
+
+async def _collect_stream(head: list, chunks, on_token: Callable[[str], None] | None = None) -> tuple[str, str | None]:
     """
-    Try models in order. Returns: (text_output, model_used)
+    Drain the already-read head chunks, then the rest of the async chunk iterator, calling on_token (if given)
+    with the text received so far at most every _STREAM_FLUSH_S, plus once at the end.
+    Returns: (text, finish_reason)
     """
+    async def _all_chunks():
+        for chunk in head:
+            yield chunk
+        async for chunk in chunks:
+            yield chunk
+
+    text = ""
+    flushed_len = 0
+    last_flush = time.monotonic()
+    finish_reason = None
+    async for chunk in _all_chunks():
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+        piece = choice.delta.content
+        if piece:
+            text += piece
+            if on_token is not None and time.monotonic() - last_flush >= _STREAM_FLUSH_S:
+                on_token(text)
+                flushed_len = len(text)
+                last_flush = time.monotonic()
+    if on_token is not None and len(text) != flushed_len:
+        on_token(text)
+    return text, finish_reason
+
+async def _open_stream(client: AsyncOpenAI, model: str, messages: list[dict], temperature: float,
+                       max_tokens: int | None):
+    """
+    Start a streamed completion and read up to its first content chunk.
+    Returns: (stream, chunk_iterator, head_chunks)
+    """
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        top_p=TOP_P,
+        max_completion_tokens=max_tokens,
+        response_format={"type": "json_object"},
+        stream=True,
+    )
+    try:
+        chunks = stream.__aiter__()
+        head = []
+        async for chunk in chunks:
+            head.append(chunk)
+            if chunk.choices and (chunk.choices[0].delta.content or chunk.choices[0].finish_reason):
+                break
+        return stream, chunks, head
+    except BaseException:
+        await stream.close()
+        raise
+
+async def _race_first_chunk(client: AsyncOpenAI, remaining: list[str], messages: list[dict], temperature: float,
+                            max_tokens: int | None, stagger_s: float):
+    """
+    Start remaining[0]; start the next model alongside it if nothing has arrived after stagger_s, or at once
+    if a model fails. Started models are popped from remaining. The stagger is measured against
+    time-to-first-chunk, not a full completion.
+    Returns: (stream, chunk_iterator, head_chunks, model) for the first model to produce output; the other
+    started requests are cancelled/closed.
+    """
+    task_model = {}
     last_err = None
-    for m in models:
-        try:
-            resp = client.chat.completions.create(
-                model=m,
-                messages=messages,
-                temperature=temperature,
+
+    def _launch() -> asyncio.Task:
+        m = remaining.pop(0)
+        task = asyncio.create_task(_open_stream(client, m, messages, temperature, max_tokens))
+        task_model[task] = m
+        return task
+
+    pending = {_launch()}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=stagger_s if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED,
             )
-            text = resp.choices[0].message.content
-            return text, m
+
+            # Stagger elapsed without a first chunk: hedge with the next model
+            if not done:
+                pending.add(_launch())
+                continue
+
+            winner = None
+            for task in done:
+                if task.exception() is not None:
+                    last_err = task.exception()
+                elif winner is None:
+                    winner = task
+                else:
+                    await task.result()[0].close()
+
+            if winner is not None:
+                stream, chunks, head = winner.result()
+                return stream, chunks, head, task_model[winner]
+
+            # A model failed: don't wait out the stagger before trying the next one
+            if remaining:
+                pending.add(_launch())
+    finally:
+        # Still connecting: cancelling closes the request (and any stream it already opened)
+        for task in pending:
+            task.cancel()
+
+    raise last_err
+
+async def _call_with_fallback(client: AsyncOpenAI, models: list[str], messages: list[dict],
+                              schema: type[BaseModel], temperature: float = 0.2, max_tokens: int | None = None,
+                              on_token: Callable[[str], None] | None = None,
+                              stagger_s: float = HEDGE_STAGGER_S) -> tuple[dict, str]:
+    """
+    Hedged, streamed model fallback. Returns: (validated_output, model_used)
+    Models race to their first chunk (see _race_first_chunk); only the winner is streamed, into on_token if given.
+    If the winner then fails (error, truncated output, schema check), the models not started yet are raced the same way.
+    """
+    remaining = list(models)
+    last_err = None
+    while remaining:
+        # Raises the last error if every model started in this round fails before producing output
+        stream, chunks, head, m = await _race_first_chunk(
+            client, remaining, messages, temperature, max_tokens, stagger_s
+        )
+        try:
+            text, finish_reason = await _collect_stream(head, chunks, on_token)
+            _check_finish(finish_reason, m)
+            return schema.model_validate_json(text).model_dump(), m
         except Exception as e:
             last_err = e
-            continue
+        finally:
+            await stream.close()
     raise last_err
 
-def generate_dashboard_summary(evidence: dict, model: str = "gpt-4o-mini", fallback_models: list[str] | None = None) -> dict:
-    client = _get_client()
+# Prompt-size limits for the evidence sent to the model
+_PROMPT_TOP_N = 3
+_PROMPT_MIN_DELTA_SHARE = 0.01  # drop driver rows moving < 1% of current total watch minutes
 
-    # Try selected model first, then fallbacks
-    models = [model] + (fallback_models or [])
+def _round_floats(value, ndigits: int = 1):
+    if isinstance(value, float):
+        return round(value, ndigits)
+    if isinstance(value, dict):
+        return {k: _round_floats(v, ndigits) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round_floats(v, ndigits) for v in value]
+    return value
 
-    system_msg = (
-        "You are an analytics assistant. Summarize the dashboard using ONLY the provided evidence. "
-        "Be specific with numbers (percent changes, totals, top titles). "
-        "Return JSON only with keys: headline, summary_bullets, key_changes, next_checks."
-    )
+def _minify_evidence(evidence: dict) -> dict:
+    """
+    Smaller copy of the evidence for the prompt: top lists capped, near-zero driver deltas dropped,
+    floats rounded to 1 decimal. The original dict (shown in the debug expander) is left untouched.
+    """
+    out = dict(evidence)
+
+    for period in ("current_period", "previous_period"):
+        agg = evidence.get(period)
+        if agg:
+            out[period] = {
+                k: v[:_PROMPT_TOP_N] if isinstance(v, list) else v
+                for k, v in agg.items()
+            }
+
+    changes = evidence.get("changes")
+    if changes and changes.get("driver_deltas"):
+        total = (evidence.get("current_period") or {}).get("total_watch_minutes", 0)
+        threshold = abs(total) * _PROMPT_MIN_DELTA_SHARE
+        out["changes"] = {
+            **changes,
+            "driver_deltas": {
+                dim: [r for r in rows if abs(r.get("delta") or 0) >= threshold][:_PROMPT_TOP_N]
+                for dim, rows in changes["driver_deltas"].items()
+            },
+        }
+
+    return _round_floats(out)
 
-    user_payload = {
-        "evidence": evidence,
-        "rules": [
-            "Do not invent numbers. Use only provided evidence.",
-            "summary_bullets: 3-5 bullets",
-            "key_changes: 2-4 bullets (use % changes if available)",
-            "next_checks: 2-4 bullets phrased as analytics breakdowns (by device/country/title), avoid generic marketing advice",
-        ],
-        "output_format": {
-            "headline": "string",
-            "summary_bullets": ["..."],
-            "key_changes": ["..."],
-            "next_checks": ["..."],
-        },
-    }
-
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)},
+def _dump_compact(payload: dict) -> str:
+    # orjson output is already compact and UTF-8 (no ensure_ascii escaping)
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+# Static prompt scaffolding, serialized once at import so each call only serializes the metric/evidence tail.
+_SUMMARY_SYS = (
+    "You are an analytics assistant. Summarize the dashboard using ONLY the provided evidence. "
+    "Be specific with numbers (percent changes, totals, top titles). "
+    "Return JSON only with keys: headline, summary_bullets, key_changes, next_checks."
+)
+
+_SUMMARY_RULES_JSON = _dump_compact({
+    "rules": [
+        "Do not invent numbers. Use only provided evidence.",
+        "summary_bullets: 3-5 bullets",
+        "key_changes: 2-4 bullets (use % changes if available)",
+        "next_checks: 2-4 bullets phrased as analytics breakdowns (by device/country/title), avoid generic marketing advice",
+    ],
+    "output_format": {
+        "headline": "string",
+        "summary_bullets": ["..."],
+        "key_changes": ["..."],
+        "next_checks": ["..."],
+    },
+})
+
+_EXPLAIN_SYS = (
+    "You are an analytics assistant. Explain WHY the selected metric changed using ONLY the evidence. "
+    "Separate facts from hypotheses. Avoid unsupported causality. "
+    "Return JSON only with keys: headline, what_changed, likely_drivers, next_checks."
+)
+
+_EXPLAIN_RULES_JSON = _dump_compact({
+    "rules": [
+        "Do not invent numbers. Use only provided evidence.",
+        "what_changed: facts with numbers (2-4 bullets).",
+        "likely_drivers: grounded drivers referencing device/country/title (3-6 bullets).",
+        "If you must speculate, label it as 'Hypothesis:' and keep it minimal.",
+        "next_checks: 2-4 bullets phrased as analytics breakdowns (segment/compare), not generic advice.",
+    ],
+    "output_format": {
+        "headline": "string",
+        "what_changed": ["..."],
+        "likely_drivers": ["..."],
+        "next_checks": ["..."],
+    },
+})
+
+def _summary_messages(evidence: dict) -> list[dict]:
+    user_content = _SUMMARY_RULES_JSON + "\n\nEVIDENCE:\n" + _dump_compact(_minify_evidence(evidence))
+    return [
+        {"role": "system", "content": _SUMMARY_SYS},
+        {"role": "user", "content": user_content},
     ]
 
-    text, model_used = _call_with_fallback(client, models, messages, temperature=0.2)
+def _explain_messages(evidence: dict, metric: str) -> list[dict]:
+    user_content = (
+        _EXPLAIN_RULES_JSON
+        + "\n\nMETRIC_TO_EXPLAIN: " + metric
+        + "\n\nEVIDENCE:\n" + _dump_compact(_minify_evidence(evidence))
+    )
+    return [
+        {"role": "system", "content": _EXPLAIN_SYS},
+        {"role": "user", "content": user_content},
+    ]
 
-    try:
-        out = json.loads(text)
-    except Exception:
-        out = {
-            "headline": "AI Summary",
-            "summary_bullets": [text],
-            "key_changes": [],
-            "next_checks": [],
-        }
+def _evidence_key(evidence: dict) -> str:
+    """
+    Stable hash of the evidence packet: same filters + same data snapshot -> same key.
+    """
+    canonical = orjson.dumps(evidence, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return hashlib.sha256(canonical).hexdigest()
 
-    out["_model_used"] = model_used
+# Plain in-process response cache (not st.cache_data: the streaming callback draws into a placeholder,
+# and cache_data would record and try to replay those element calls on a hit).
+_CACHE_TTL_S = 3600
+_CACHE_MAX_ENTRIES = 256
+
+# Shared by every session thread, so all access goes through _CACHE_LOCK
+_CACHE_LOCK = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _response_cache() -> dict:
+    return {}
+
+def _cache_get(key: tuple) -> dict | None:
+    with _CACHE_LOCK:
+        cache = _response_cache()
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > _CACHE_TTL_S:
+            cache.pop(key)
+            return None
+    return copy.deepcopy(entry[1])
+
+def _cache_put(key: tuple, value: dict, model: str):
+    """
+    Cache an answer under the selected model's key only if that model produced it. A fallback that won
+    (the selected model failed or was just slower than the stagger) is returned but not pinned to the key,
+    so the next click tries the selected model again.
+    """
+    if value.get("_model_used") != model:
+        return
+    entry = (time.monotonic(), copy.deepcopy(value))
+    with _CACHE_LOCK:
+        cache = _response_cache()
+        # Re-insert rather than overwrite so a refreshed entry moves to the newest slot
+        cache.pop(key, None)
+        cache[key] = entry
+        # Evict oldest entries first (dicts keep insertion order)
+        while len(cache) > _CACHE_MAX_ENTRIES:
+            cache.pop(next(iter(cache)))
+
+def _summary_key(evidence: dict, model: str, fallback_models: list[str] | None) -> tuple:
+    return ("summary", _evidence_key(evidence), model, tuple(fallback_models or []))
+
+def _explain_key(evidence: dict, metric: str, model: str, fallback_models: list[str] | None) -> tuple:
+    return ("explain", _evidence_key(evidence), metric, model, tuple(fallback_models or []))
+
+def generate_dashboard_summary(evidence: dict, model: str = "gpt-4o-mini", fallback_models: list[str] | None = None,
+                               on_token: Callable[[str], None] | None = None) -> dict:
+    """
+    Repeat calls with identical evidence + model return the cached result without an API call
+    (on_token is not invoked on a cache hit).
+    """
+    key = _summary_key(evidence, model, fallback_models)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    out = _run_on_loop(
+        lambda client, forward: generate_dashboard_summary_async(
+            client, evidence, model=model, fallback_models=fallback_models, on_token=forward
+        ),
+        on_token,
+    )
+    _cache_put(key, out, model)
     return out
 
 def explain_change(evidence: dict, metric: str = "total_watch_minutes",
-                   model: str = "gpt-4o-mini", fallback_models: list[str] | None = None) -> dict:
-    client = _get_client()
-    models = [model] + (fallback_models or [])
+                   model: str = "gpt-4o-mini", fallback_models: list[str] | None = None,
+                   on_token: Callable[[str], None] | None = None) -> dict:
+    key = _explain_key(evidence, metric, model, fallback_models)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
 
-    system_msg = (
-        "You are an analytics assistant. Explain WHY the selected metric changed using ONLY the evidence. "
-        "Separate facts from hypotheses. Avoid unsupported causality. "
-        "Return JSON only with keys: headline, what_changed, likely_drivers, next_checks."
+    out = _run_on_loop(
+        lambda client, forward: explain_change_async(
+            client, evidence, metric=metric, model=model, fallback_models=fallback_models, on_token=forward
+        ),
+        on_token,
     )
+    _cache_put(key, out, model)
+    return out
 
-    user_payload = {
-        "metric_to_explain": metric,
-        "evidence": evidence,
-        "rules": [
-            "Do not invent numbers. Use only provided evidence.",
-            "what_changed: facts with numbers (2-4 bullets).",
-            "likely_drivers: grounded drivers referencing device/country/title (3-6 bullets).",
-            "If you must speculate, label it as 'Hypothesis:' and keep it minimal.",
-            "next_checks: 2-4 bullets phrased as analytics breakdowns (segment/compare), not generic advice.",
-        ],
-        "output_format": {
-            "headline": "string",
-            "what_changed": ["..."],
-            "likely_drivers": ["..."],
-            "next_checks": ["..."],
-        },
-    }
-
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": json.dumps(user_payload, ensure_ascii=False)},
-    ]
+async def generate_dashboard_summary_async(client: AsyncOpenAI, evidence: dict, model: str = "gpt-4o-mini",
+                                           fallback_models: list[str] | None = None,
+                                           on_token: Callable[[str], None] | None = None) -> dict:
+    # Try selected model first, then fallbacks
+    models = [model] + (fallback_models or [])
 
-    text, model_used = _call_with_fallback(client, models, messages, temperature=0.2)
+    messages = _summary_messages(evidence)
+    out, model_used = await _call_with_fallback(
+        client, models, messages, SummaryOut,
+        temperature=SUMMARY_TEMPERATURE, max_tokens=SUMMARY_MAX_TOKENS, on_token=on_token,
+    )
+    out["_model_used"] = model_used
+    return out
 
-    try:
-        out = json.loads(text)
-    except Exception:
-        out = {
-            "headline": "AI Explanation",
-            "what_changed": [text],
-            "likely_drivers": [],
-            "next_checks": [],
-        }
+async def explain_change_async(client: AsyncOpenAI, evidence: dict, metric: str = "total_watch_minutes",
+                               model: str = "gpt-4o-mini", fallback_models: list[str] | None = None,
+                               on_token: Callable[[str], None] | None = None) -> dict:
+    models = [model] + (fallback_models or [])
 
+    messages = _explain_messages(evidence, metric)
+    out, model_used = await _call_with_fallback(
+        client, models, messages, ExplainOut,
+        temperature=EXPLAIN_TEMPERATURE, max_tokens=EXPLAIN_MAX_TOKENS, on_token=on_token,
+    )
     out["_model_used"] = model_used
     return out
-    
 
+def generate_both(evidence: dict, metric: str = "total_watch_minutes",
+                  model: str = "gpt-4o-mini",
+                  fallback_models: list[str] | None = None) -> tuple[dict | BaseException, dict | BaseException]:
+    """
+    Run the summary and the explanation concurrently on the shared event loop and client.
+    Returns: (summary, explanation)
+    Either half is the raised exception instead of a dict if that request failed, so one failure
+    doesn't discard the other answer.
+    Shares the per-task cache with generate_dashboard_summary / explain_change; only missing results are fetched.
+    """
+    summary_key = _summary_key(evidence, model, fallback_models)
+    explain_key = _explain_key(evidence, metric, model, fallback_models)
+    summary = _cache_get(summary_key)
+    explanation = _cache_get(explain_key)
+    if summary is not None and explanation is not None:
+        return summary, explanation
+
+    async def _run(client: AsyncOpenAI, _forward):
+        jobs = []
+        if summary is None:
+            jobs.append(generate_dashboard_summary_async(
+                client, evidence, model=model, fallback_models=fallback_models
+            ))
+        if explanation is None:
+            jobs.append(explain_change_async(
+                client, evidence, metric=metric, model=model, fallback_models=fallback_models
+            ))
+        return await asyncio.gather(*jobs, return_exceptions=True)
 
+    results = iter(_run_on_loop(_run))
+    if summary is None:
+        summary = next(results)
+        if not isinstance(summary, BaseException):
+            _cache_put(summary_key, summary, model)
+    if explanation is None:
+        explanation = next(results)
+        if not isinstance(explanation, BaseException):
+            _cache_put(explain_key, explanation, model)
+    return summary, explanation
@@ -1,10 +1,11 @@
+import html
 from pathlib import Path
 import streamlit as st
 import plotly.express as px
 
-from data_layer import load_data
+from data_layer import load_data, slice_dates
 from evidence_builder import build_evidence
-from ai_layer import generate_dashboard_summary, explain_change
+from ai_layer import generate_dashboard_summary, explain_change, generate_both
 from feedback_store import init_db, save_review, get_recent_reviews
 
 
@@ -89,11 +90,11 @@ def close_card():
 def render_bullets(items: list[str]):
     if not items:
         return
-    html = "<div class='list-tight'><ul>"
-    for x in items:
-        html += f"<li>{x}</li>"
-    html += "</ul></div>"
-    st.markdown(html, unsafe_allow_html=True)
+    # Items come from the LLM: escape them before injecting into raw HTML
+    st.markdown(
+        "<div class='list-tight'><ul>" + "".join(f"<li>{html.escape(str(x))}</li>" for x in items) + "</ul></div>",
+        unsafe_allow_html=True,
+    )
 
 
 def fmt_delta(pct_val):
@@ -110,6 +111,22 @@ def get_final_df():
     return load_data()
 
 
+def filter_df(df, start_date, end_date, selected_genre: str):
+    out = slice_dates(df, start_date, end_date).copy()
+
+    if selected_genre != "All":
+        out = out[out["genre_primary"] == selected_genre]
+    return out
+
+
+# Keyed on the filter values only; unrelated widget reruns (e.g. Feedback tab) hit the cache.
+# Bounded like the AI response cache so every filter combination ever picked isn't kept for the process lifetime.
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def get_evidence(start_date, end_date, selected_genre: str) -> dict:
+    df = get_final_df()
+    return build_evidence(df, filter_df(df, start_date, end_date, selected_genre), start_date, end_date, selected_genre)
+
+
 final_df = get_final_df()
 
 
@@ -136,39 +153,34 @@ else:
 genre_options = ["All"] + sorted(final_df["genre_primary"].dropna().unique().tolist())
 selected_genre = st.sidebar.selectbox("Select genre", genre_options)
 
-filtered_df = final_df[
-    (final_df["watch_date"].dt.date >= start_date)
-    & (final_df["watch_date"].dt.date <= end_date)
-].copy()
-
-if selected_genre != "All":
-    filtered_df = filtered_df[filtered_df["genre_primary"] == selected_genre]
+filtered_df = filter_df(final_df, start_date, end_date, selected_genre)
 
 
 # -----------------------------
 # Phase 1 metrics
 # -----------------------------
-filtered_df["watch_day"] = filtered_df["watch_date"].dt.date
+# Day bucket as datetime64 (normalize) rather than an object Series of date values
+filtered_df["watch_day"] = filtered_df["watch_date"].dt.normalize()
 
 watch_time_trend = (
     filtered_df.groupby("watch_day", as_index=False)["watch_duration_minutes"].sum()
 )
 
 watch_time_by_genre = (
-    filtered_df.groupby("genre_primary", as_index=False)["watch_duration_minutes"]
+    filtered_df.groupby("genre_primary", as_index=False, observed=True)["watch_duration_minutes"]
     .sum()
     .sort_values("watch_duration_minutes", ascending=False)
 )
 
 top_titles = (
-    filtered_df.groupby("title", as_index=False)["watch_duration_minutes"]
+    filtered_df.groupby("title", as_index=False, observed=True)["watch_duration_minutes"]
     .sum()
     .sort_values("watch_duration_minutes", ascending=False)
     .head(10)
 )
 
 # Evidence (Phase 2)
-evidence = build_evidence(final_df, filtered_df, start_date, end_date, selected_genre)
+evidence = get_evidence(start_date, end_date, selected_genre)
 changes = evidence.get("changes", {})
 cur = evidence.get("current_period", {})
 prev = evidence.get("previous_period", {})
@@ -179,13 +191,18 @@ prev = evidence.get("previous_period", {})
 assets_dir = Path(__file__).resolve().parent.parent / "assets"
 logo_path = assets_dir / "netflix_logo.png"
 
-if logo_path.exists():
-    st.image(str(logo_path), width=56)
+
+@st.cache_data(show_spinner=False)
+def get_logo_bytes(path: Path) -> bytes | None:
+    return path.read_bytes() if path.exists() else None
+
+
+logo_bytes = get_logo_bytes(logo_path)
 
 left, right = st.columns([1, 6], vertical_alignment="center")
 with left:
-    if logo_path.exists():
-        st.image(str(logo_path), width=56)
+    if logo_bytes:
+        st.image(logo_bytes, width=56)
     else:
         st.markdown("<span class='pill'>N</span>", unsafe_allow_html=True)
 
@@ -322,6 +339,30 @@ with tab2:
 
     fallback_models = ["gpt-5.2-mini", "gpt-4o-mini"]  # tried in order if selected fails
 
+    # Fire summary + explanation in parallel (explains the metric currently picked on the right)
+    run_both = st.button("Generate Both", key="btn_both")
+    if run_both:
+        with st.spinner("Generating summary and explanation..."):
+            try:
+                summary_res, explain_res = generate_both(
+                    evidence,
+                    metric=st.session_state.get("metric_choice_split", "total_watch_minutes"),
+                    model=model_choice,
+                    fallback_models=fallback_models,
+                )
+            except Exception as e:
+                st.error(f"AI generation failed: {e}")
+            else:
+                # Keep whichever half succeeded; report the other
+                if isinstance(summary_res, BaseException):
+                    st.error(f"AI summary failed: {summary_res}")
+                else:
+                    st.session_state.ai_summary = summary_res
+                if isinstance(explain_res, BaseException):
+                    st.error(f"AI explanation failed: {explain_res}")
+                else:
+                    st.session_state.ai_explain = explain_res
+
     close_card()
 
     # --- Two-column layout ---
@@ -336,21 +377,25 @@ with tab2:
         run_summary = st.button("Generate Summary", key="btn_summary")
 
         if run_summary:
-            with st.spinner("Generating AI summary..."):
-                try:
-                    st.session_state.ai_summary = generate_dashboard_summary(
-    evidence,
-    model=model_choice,
-    fallback_models=fallback_models
-)
-                except Exception as e:
-                    st.error(f"AI summary failed: {e}")
+            # Stream the raw response into a placeholder, then swap in the rendered result
+            stream_box = st.empty()
+            stream_box.caption("Generating AI summary...")
+            try:
+                st.session_state.ai_summary = generate_dashboard_summary(
+                    evidence,
+                    model=model_choice,
+                    fallback_models=fallback_models,
+                    on_token=lambda text: stream_box.code(text, language="json"),
+                )
+            except Exception as e:
+                st.error(f"AI summary failed: {e}")
+            stream_box.empty()
 
         if st.session_state.ai_summary:
             res = st.session_state.ai_summary
             st.caption(f"Model used: {res.get('_model_used', 'unknown')}")
 
-            st.markdown(f"<span class='chip'>{res.get('headline','AI Summary')}</span>", unsafe_allow_html=True)
+            st.markdown(f"<span class='chip'>{html.escape(res.get('headline','AI Summary'))}</span>", unsafe_allow_html=True)
 
             st.markdown("<span class='chip'>Summary</span>", unsafe_allow_html=True)
             render_bullets(res.get("summary_bullets", []))
@@ -381,22 +426,25 @@ with tab2:
         run_explain = st.button("Explain Now", key="btn_explain")
 
         if run_explain:
-            with st.spinner("Explaining change..."):
-                try:
-                    st.session_state.ai_explain = explain_change(
-    evidence,
-    metric=metric_choice,
-    model=model_choice,
-    fallback_models=fallback_models
-)
-                except Exception as e:
-                    st.error(f"AI explanation failed: {e}")
+            stream_box = st.empty()
+            stream_box.caption("Explaining change...")
+            try:
+                st.session_state.ai_explain = explain_change(
+                    evidence,
+                    metric=metric_choice,
+                    model=model_choice,
+                    fallback_models=fallback_models,
+                    on_token=lambda text: stream_box.code(text, language="json"),
+                )
+            except Exception as e:
+                st.error(f"AI explanation failed: {e}")
+            stream_box.empty()
 
         if st.session_state.ai_explain:
             res = st.session_state.ai_explain
             st.caption(f"Model used: {res.get('_model_used', 'unknown')}")
 
-            st.markdown(f"<span class='chip'>{res.get('headline','AI Explanation')}</span>", unsafe_allow_html=True)
+            st.markdown(f"<span class='chip'>{html.escape(res.get('headline','AI Explanation'))}</span>", unsafe_allow_html=True)
 
             st.markdown("<span class='chip'>What changed</span>", unsafe_allow_html=True)
             render_bullets(res.get("what_changed", []))
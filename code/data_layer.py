@@ -5,14 +5,40 @@ import pandas as pd
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT_DIR / "datasets"
 
+# Columns of repeated strings: category dtype makes the groupbys hash int codes instead of strings
+CATEGORY_COLS = ["genre_primary", "content_type", "title", "device_type", "location_country", "rating"]
+
+def read_movies_csv() -> pd.DataFrame:
+    return pd.read_csv(DATA_DIR / "movies.csv")
+
+def read_watch_history_csv() -> pd.DataFrame:
+    return pd.read_csv(
+        DATA_DIR / "watch_history.csv",
+        dtype={"device_type": "category", "location_country": "category"},
+        parse_dates=["watch_date"],
+        date_format="%Y-%m-%d",
+    )
+
+def _read_dataset(name: str, read_csv) -> pd.DataFrame:
+    """
+    Prefer the pre-typed Parquet copy (written by prepare_data.py) unless it is missing or older than
+    its CSV (the CSV was edited since), in which case read the CSV.
+    """
+    parquet_path = DATA_DIR / f"{name}.parquet"
+    csv_path = DATA_DIR / f"{name}.csv"
+    if parquet_path.exists() and (
+        not csv_path.exists() or parquet_path.stat().st_mtime >= csv_path.stat().st_mtime
+    ):
+        return pd.read_parquet(parquet_path, engine="pyarrow")
+    return read_csv()
+
 def load_data():
-    movies_df = pd.read_csv(DATA_DIR / "movies.csv")
-    watch_df = pd.read_csv(DATA_DIR / "watch_history.csv")
+    movies_df = _read_dataset("movies", read_movies_csv)
+    watch_df = _read_dataset("watch_history", read_watch_history_csv)
 
     movies_df.columns = movies_df.columns.str.lower().str.strip()
     watch_df.columns = watch_df.columns.str.lower().str.strip()
 
-    watch_df["watch_date"] = pd.to_datetime(watch_df["watch_date"])
     watch_df["watch_duration_minutes"] = watch_df["watch_duration_minutes"].fillna(0)
 
     final_df = watch_df.merge(
@@ -31,4 +57,22 @@ def load_data():
         how="left",
     )
 
-    return final_df
\ No newline at end of file
+    for c in CATEGORY_COLS:
+        if c in final_df.columns:
+            final_df[c] = final_df[c].astype("category")
+
+    # Sorted DatetimeIndex on watch_date so date filters are a binary-search slice (see slice_dates)
+    final_df = final_df.sort_values("watch_date", kind="stable").set_index("watch_date", drop=False)
+    final_df.index.name = None
+
+    return final_df
+
+
+def slice_dates(df: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+    """
+    Rows with watch_date between start_date and end_date (inclusive, whole days).
+    Expects the sorted DatetimeIndex built by load_data.
+    """
+    start_ts = pd.Timestamp(start_date).normalize()
+    end_ts = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1) - pd.Timedelta(1, unit="ns")
+    return df.loc[start_ts:end_ts]
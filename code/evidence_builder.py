@@ -1,7 +1,10 @@
 from __future__ import annotations
 from datetime import timedelta
+import numpy as np
 import pandas as pd
 
+from data_layer import slice_dates
+
 
 def _safe_pct_change(current: float, previous: float) -> float | None:
     if previous == 0:
@@ -9,51 +12,54 @@ def _safe_pct_change(current: float, previous: float) -> float | None:
     return (current - previous) / previous * 100.0
 
 
-def _top_n(df: pd.DataFrame, group_col: str, value_col: str, n: int = 5) -> list[dict]:
-    if group_col not in df.columns:
+# Dimensions summed once per period and shared by the top-N lists and the driver deltas
+_DIMENSIONS = ["genre_primary", "title", "device_type", "location_country"]
+_VALUE_COL = "watch_duration_minutes"
+
+
+def _dimension_sums(df: pd.DataFrame, value_col: str = _VALUE_COL) -> dict[str, pd.Series]:
+    return {
+        col: df.groupby(col, observed=True)[value_col].sum()
+        for col in _DIMENSIONS
+        if col in df.columns
+    }
+
+
+def _top_n(sums: pd.Series | None, group_col: str, value_col: str, n: int = 5) -> list[dict]:
+    if sums is None:
         return []
-    return (
-        df.groupby(group_col)[value_col]
-        .sum()
-        .sort_values(ascending=False)
-        .head(n)
-        .reset_index()
-        .to_dict(orient="records")
-    )
+    s = sums.nlargest(n)
+    return [{group_col: k, value_col: float(v)} for k, v in zip(s.index.to_numpy(), s.to_numpy())]
 
 
-def _period_aggregates(df: pd.DataFrame) -> dict:
+def _period_aggregates(df: pd.DataFrame, sums: dict[str, pd.Series]) -> dict:
     return {
-        "total_watch_minutes": round(float(df["watch_duration_minutes"].sum()), 2),
+        "total_watch_minutes": round(float(df[_VALUE_COL].sum()), 2),
         "active_users": int(df["user_id"].nunique()),
         "titles_watched": int(df["title"].nunique()),
-        "top_genres": _top_n(df, "genre_primary", "watch_duration_minutes", 5),
-        "top_titles": _top_n(df, "title", "watch_duration_minutes", 5),
-        "watch_by_device": _top_n(df, "device_type", "watch_duration_minutes", 5),
-        "watch_by_country": _top_n(df, "location_country", "watch_duration_minutes", 5),
+        "top_genres": _top_n(sums.get("genre_primary"), "genre_primary", _VALUE_COL, 5),
+        "top_titles": _top_n(sums.get("title"), "title", _VALUE_COL, 5),
+        "watch_by_device": _top_n(sums.get("device_type"), "device_type", _VALUE_COL, 5),
+        "watch_by_country": _top_n(sums.get("location_country"), "location_country", _VALUE_COL, 5),
     }
 
 
 def _delta_table(
-    cur_df: pd.DataFrame,
-    prev_df: pd.DataFrame,
+    cur_series: pd.Series | None,
+    prev_series: pd.Series | None,
     key: str,
-    value: str,
     n: int = 5,
     sort_by_abs: bool = True,
 ) -> list[dict]:
     """
-    Creates a delta table for a driver dimension.
+    Creates a delta table for a driver dimension from per-period sums (see _dimension_sums).
 
     Output rows: {key: <name>, current: <float>, previous: <float>, delta: <float>, pct_change: <float|None>}
     Sorted by absolute delta (default) or by delta.
     """
-    if key not in cur_df.columns or key not in prev_df.columns:
+    if cur_series is None or prev_series is None:
         return []
 
-    cur_series = cur_df.groupby(key)[value].sum()
-    prev_series = prev_df.groupby(key)[value].sum()
-
     combined = pd.DataFrame(
         {
             "current": cur_series,
@@ -62,10 +68,10 @@ def _delta_table(
     ).fillna(0.0)
 
     combined["delta"] = combined["current"] - combined["previous"]
-    combined["pct_change"] = combined.apply(
-        lambda r: _safe_pct_change(float(r["current"]), float(r["previous"])),
-        axis=1,
-    )
+    cur = combined["current"].to_numpy(dtype=float)
+    prev = combined["previous"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        combined["pct_change"] = np.where(prev == 0, np.nan, (cur - prev) / prev * 100.0)
 
     if sort_by_abs:
         combined = combined.reindex(combined["delta"].abs().sort_values(ascending=False).index)
@@ -81,7 +87,8 @@ def _delta_table(
         combined[c] = combined[c].astype(float).round(2)
 
     # pct_change keep as float (rounded) or None
-    combined["pct_change"] = combined["pct_change"].apply(lambda x: None if x is None else round(float(x), 2))
+    pct = combined["pct_change"].round(2)
+    combined["pct_change"] = pct.astype(object).where(pct.notna(), None)
 
     return combined[[key, "current", "previous", "delta", "pct_change"]].to_dict(orient="records")
 
@@ -118,7 +125,8 @@ def build_evidence(
         return evidence
 
     # Current period aggregates
-    current = _period_aggregates(filtered_df)
+    cur_sums = _dimension_sums(filtered_df)
+    current = _period_aggregates(filtered_df, cur_sums)
     evidence["current_period"] = current
 
     # Previous period window (same length, immediately before start_date)
@@ -129,10 +137,7 @@ def build_evidence(
     prev_end_dt = start_dt - timedelta(days=1)
     prev_start_dt = prev_end_dt - timedelta(days=window_days - 1)
 
-    prev_df = full_df[
-        (full_df["watch_date"] >= prev_start_dt)
-        & (full_df["watch_date"] <= prev_end_dt)
-    ].copy()
+    prev_df = slice_dates(full_df, prev_start_dt, prev_end_dt).copy()
 
     # Apply same genre filter to previous period
     if selected_genre != "All":
@@ -162,26 +167,29 @@ def build_evidence(
         return evidence
 
     # Previous period aggregates
-    previous = _period_aggregates(prev_df)
+    prev_sums = _dimension_sums(prev_df)
+    previous = _period_aggregates(prev_df, prev_sums)
     evidence["previous_period"] = previous
 
     # % changes
-    total_pct = _safe_pct_change(current["total_watch_minutes"], previous["total_watch_minutes"])
-    users_pct = _safe_pct_change(float(current["active_users"]), float(previous["active_users"]))
-    titles_pct = _safe_pct_change(float(current["titles_watched"]), float(previous["titles_watched"]))
+    # (inlined _safe_pct_change: None when the previous value is 0)
+    cur_total, prev_total = current["total_watch_minutes"], previous["total_watch_minutes"]
+    cur_users, prev_users = current["active_users"], previous["active_users"]
+    cur_titles, prev_titles = current["titles_watched"], previous["titles_watched"]
+    total_pct = None if prev_total == 0 else (cur_total - prev_total) / prev_total * 100.0
+    users_pct = None if prev_users == 0 else (cur_users - prev_users) / prev_users * 100.0
+    titles_pct = None if prev_titles == 0 else (cur_titles - prev_titles) / prev_titles * 100.0
 
     # Engagement intensity: minutes per user
-    current_mpu = current["total_watch_minutes"] / max(current["active_users"], 1)
-    prev_mpu = previous["total_watch_minutes"] / max(previous["active_users"], 1)
-    mpu_pct = _safe_pct_change(current_mpu, prev_mpu)
+    current_mpu = cur_total / max(cur_users, 1)
+    prev_mpu = prev_total / max(prev_users, 1)
+    mpu_pct = None if prev_mpu == 0 else (current_mpu - prev_mpu) / prev_mpu * 100.0
 
     # Driver deltas: WHAT drove the change (grounded)
+    # (genre_primary is most useful when genre = All)
     driver_deltas = {
-        "device_type": _delta_table(filtered_df, prev_df, "device_type", "watch_duration_minutes", n=6),
-        "location_country": _delta_table(filtered_df, prev_df, "location_country", "watch_duration_minutes", n=6),
-        "title": _delta_table(filtered_df, prev_df, "title", "watch_duration_minutes", n=6),
-        # optional: genre breakdown (useful when genre = All)
-        "genre_primary": _delta_table(filtered_df, prev_df, "genre_primary", "watch_duration_minutes", n=6),
+        dim: _delta_table(cur_sums.get(dim), prev_sums.get(dim), dim, n=6)
+        for dim in ["device_type", "location_country", "title", "genre_primary"]
     }
 
     evidence["changes"] = {
@@ -1,12 +1,30 @@
 import sqlite3
+import threading
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
+
+import streamlit as st
 
 DB_PATH = Path(__file__).resolve().parent.parent / "reviews.db"
 
+# Streamlit sessions run on separate threads; serialize access to the shared connection
+_LOCK = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _get_conn() -> sqlite3.Connection:
+    """
+    One long-lived connection (autocommit; transactions are explicit) shared across reruns; every use goes
+    through _LOCK. WAL + synchronous=NORMAL turn each commit into a log append without an fsync.
+    The database file is local runtime state (not tracked in git); connect() creates it on first use.
+    """
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute("""
+    with _LOCK:
+        _get_conn().execute("""
             CREATE TABLE IF NOT EXISTS reviews (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 created_at TEXT NOT NULL,
@@ -14,20 +32,26 @@ def init_db():
                 comment TEXT NOT NULL
             )
         """)
-        conn.commit()
 
 def save_review(rating: int, comment: str):
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.execute(
-            "INSERT INTO reviews(created_at, rating, comment) VALUES (?, ?, ?)",
-            (datetime.utcnow().isoformat(), rating, comment.strip())
-        )
-        conn.commit()
+    # Build the row before taking the lock so the transaction only covers the insert
+    row = (datetime.now(timezone.utc).isoformat(timespec="seconds"), rating, comment.strip())
+    conn = _get_conn()
+    with _LOCK:
+        conn.execute("BEGIN")
+        try:
+            conn.execute("INSERT INTO reviews(created_at, rating, comment) VALUES (?, ?, ?)", row)
+            conn.execute("COMMIT")
+        except Exception:
+            # Never leave the shared connection inside an open transaction (e.g. COMMIT hit SQLITE_BUSY)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
 
 def get_recent_reviews(limit: int = 10):
-    with sqlite3.connect(DB_PATH) as conn:
-        rows = conn.execute(
+    with _LOCK:
+        rows = _get_conn().execute(
             "SELECT created_at, rating, comment FROM reviews ORDER BY id DESC LIMIT ?",
             (limit,)
         ).fetchall()
-    return rows
\ No newline at end of file
+    return rows
@@ -0,0 +1,19 @@
+"""
+One-time conversion of the CSV datasets to Parquet.
+load_data() picks up datasets/<name>.parquet when it exists, skipping CSV parsing on cold starts.
+
+Usage:
+    python code/prepare_data.py
+"""
+from data_layer import DATA_DIR, read_movies_csv, read_watch_history_csv
+
+
+def main():
+    for name, read_csv in [("movies", read_movies_csv), ("watch_history", read_watch_history_csv)]:
+        out_path = DATA_DIR / f"{name}.parquet"
+        read_csv().to_parquet(out_path, engine="pyarrow", index=False)
+        print(f"Wrote {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+import ai_layer
+
+MESSAGES = [{"role": "user", "content": "evidence"}]
+VALID = ['{"headline": "h", ', '"summary_bullets": ["a"]}']
+
+
+def _chunk(content=None, finish_reason=None):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)])
+
+
+class FakeStream:
+    def __init__(self, client, model, delay, pieces, finish_reason):
+        self.client, self.model = client, model
+        self.delay, self.pieces, self.finish_reason = delay, pieces, finish_reason
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await asyncio.sleep(self.delay)
+        for i, piece in enumerate(self.pieces):
+            last = i == len(self.pieces) - 1
+            yield _chunk(piece, self.finish_reason if last else None)
+
+    async def close(self):
+        self.client.closed.append(self.model)
+
+
+class FakeClient:
+    """
+    Stand-in for AsyncOpenAI. behaviours maps model -> Exception to raise on create, or a dict with
+    delay (seconds before the first chunk), pieces and finish_reason for the stream.
+    """
+    def __init__(self, behaviours: dict):
+        self.behaviours = behaviours
+        self.started = []
+        self.opened = []
+        self.closed = []
+        self.t0 = time.monotonic()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, **kwargs):
+        self.started.append((model, time.monotonic() - self.t0))
+        behaviour = self.behaviours[model]
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        self.opened.append(model)
+        return FakeStream(
+            self, model,
+            behaviour.get("delay", 0.0),
+            behaviour.get("pieces", VALID),
+            behaviour.get("finish_reason", "stop"),
+        )
+
+
+def _call(client, models, stagger_s=0.2, on_token=None):
+    return asyncio.run(ai_layer._call_with_fallback(
+        client, models, MESSAGES, ai_layer.SummaryOut, on_token=on_token, stagger_s=stagger_s
+    ))
+
+
+def test_hung_primary_loses_to_fallback():
+    client = FakeClient({"a": {"delay": 30.0}, "b": {}})
+    tokens = []
+
+    t0 = time.monotonic()
+    out, model = _call(client, ["a", "b"], on_token=tokens.append)
+
+    assert model == "b"
+    assert out["summary_bullets"] == ["a"]
+    assert time.monotonic() - t0 < 2
+    assert [m for m, _ in client.started] == ["a", "b"]
+    assert client.started[1][1] >= 0.2
+    assert tokens[-1] == "".join(VALID)
+    # The hung request was cancelled, not left waiting for its first chunk
+    assert "a" in client.closed
+
+
+def test_failed_primary_starts_next_model_at_once():
+    client = FakeClient({"a": RuntimeError("boom"), "b": {}})
+
+    out, model = _call(client, ["a", "b"], stagger_s=5.0)
+
+    assert model == "b"
+    assert [m for m, _ in client.started] == ["a", "b"]
+    assert client.started[1][1] < 1
+
+
+def test_truncated_winner_retries_only_models_not_started():
+    client = FakeClient({
+        "a": {"delay": 30.0},
+        "b": {"pieces": ['{"headline": "h", "summ'], "finish_reason": "length"},
+        "c": {},
+    })
+
+    out, model = _call(client, ["a", "b", "c"])
+
+    assert model == "c"
+    # a was racing when b won the first round, so it is not started again
+    assert [m for m, _ in client.started] == ["a", "b", "c"]
+
+
+def test_all_models_fail_raises_last_error():
+    client = FakeClient({"a": RuntimeError("a down"), "b": ValueError("b down")})
+
+    with pytest.raises(ValueError, match="b down"):
+        _call(client, ["a", "b"])
+
+
+def test_invalid_output_from_every_model_raises():
+    client = FakeClient({"a": {"pieces": ['{"headline": 1}']}})
+
+    with pytest.raises(ValidationError):
+        _call(client, ["a"])
+    assert client.closed == ["a"]
+
+
+def test_every_opened_stream_is_closed():
+    client = FakeClient({
+        "a": {"delay": 30.0},
+        "b": {"pieces": ['{"headline": "h", "summ'], "finish_reason": "length"},
+        "c": {"delay": 0.05},
+        "d": {"delay": 0.05},
+    })
+
+    _call(client, ["a", "b", "c", "d"], stagger_s=0.01)
+
+    # a loses round one still connecting, b wins it but truncates, d loses round two to c
+    assert client.opened == ["a", "b", "c", "d"]
+    assert sorted(client.closed) == sorted(client.opened)
+
+
+def test_expired_cache_entry_is_evicted(monkeypatch):
+    cache = {}
+    monkeypatch.setattr(ai_layer, "_response_cache", lambda: cache)
+    ai_layer._cache_put(("k",), {"_model_used": "m"}, "m")
+    assert ai_layer._cache_get(("k",)) == {"_model_used": "m"}
+
+    monkeypatch.setattr(ai_layer, "_CACHE_TTL_S", -1)
+    assert ai_layer._cache_get(("k",)) is None
+    assert cache == {}